@@ -1,16 +1,96 @@
 import sys
+import os
 import json
 import time
+import random
+import socket
+from collections import deque
 from datetime import datetime, timezone
-import urllib.request as urlreq
 import urllib.error as urlerr
+import urllib.parse as urlpars
+#urllib.request and email.utils are imported where used, they dominate startup time
 
-TIMEOUT = 10
+TIMEOUT = 10		#upper bound, also used until a host has enough latency samples
+MIN_TIMEOUT = 3
+TIMEOUT_FACTOR = 4	#adaptive timeout = p95 latency * factor
+MIN_SAMPLES = 3
+LATENCY_WINDOW = 50	#only the most recent samples per host are kept
+URL_BUDGET = TIMEOUT	#total time per url across all attempts, same worst case as a single try
+
+MAX_ATTEMPTS = 3
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 8
+RETRY_CODES = {429, 500, 502, 503, 504}
+
+BREAKER_THRESHOLD = 3	#consecutive failed urls (not attempts) before a host is skipped
+BREAKER_COOLDOWN = 30
+
+WORKER_POLL = 1
+WORKER_SETTLE = 5	#seconds an unparseable job file may still be being written
+
+#Per-host scheduler state
+host_latency = {}
+host_failures = {}
+host_open_until = {}
 
 def GetTimeStamp():
 	return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
 
+def GetHost(url):
+	return urlpars.urlsplit(url).netloc.lower()
+
+def GetTimeout(host, attempt):
+	#p95 of observed latencies, doubled on each retry so slow responses still get through
+	#Hosts without enough history get TIMEOUT, which already uses up the whole URL_BUDGET
+	samples = sorted(host_latency.get(host, []))
+	if len(samples) < MIN_SAMPLES:
+		return TIMEOUT
+	p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+	return min(TIMEOUT, max(MIN_TIMEOUT, p95 * TIMEOUT_FACTOR) * (2 ** attempt))
+
+def ParseRetryAfter(value):
+	#Retry-After is either delay-seconds or an HTTP-date
+	if value is None:
+		return None
+	try:
+		return max(0.0, float(value))
+	except ValueError:
+		pass
+	from email.utils import parsedate_to_datetime
+	try:
+		return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+	except (TypeError, ValueError):
+		return None
+
+def GetBackoff(attempt, retry_after=None):
+	if retry_after is not None:
+		return min(BACKOFF_MAX, retry_after)
+	#Full jitter
+	return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+
+def IsCircuitOpen(host):
+	return host_open_until.get(host, 0) > time.time()
+
+def RecordSuccess(host, elapsed):
+	host_failures[host] = 0
+	host_latency.setdefault(host, deque(maxlen=LATENCY_WINDOW)).append(elapsed)
+
+def RecordFailure(host):
+	host_failures[host] = host_failures.get(host, 0) + 1
+	if host_failures[host] >= BREAKER_THRESHOLD:
+		host_open_until[host] = time.time() + BREAKER_COOLDOWN
+
+def IsRetryable(e):
+	if isinstance(e, urlerr.HTTPError):
+		return e.code in RETRY_CODES
+	#DNS failures won't fix themselves within a run
+	if isinstance(e, urlerr.URLError) and isinstance(e.reason, socket.gaierror):
+		return False
+	return isinstance(e, (urlerr.URLError, TimeoutError, ConnectionError))
+
 def FetchUrl(url):
+	import urllib.request as urlreq
+
 	res = {
 		"url": url,
 		"status_code": None,
@@ -21,36 +101,74 @@ def FetchUrl(url):
 		"error": None
 	}
 
-	start_time = time.time()
-	def CalcTime():
-		return (time.time() - start_time) * 1000
-	
-	try:
-		with urlreq.urlopen(url, timeout=TIMEOUT) as response:
+	host = GetHost(url)
+	if IsCircuitOpen(host):
+		res["timestamp"] = GetTimeStamp()
+		res["error"] = f'Circuit open for {host} after {host_failures[host]} consecutive failures'
+		return res
+
+	#The breaker counts this url once, after its retries are used up
+	host_failed = False
+	deadline = time.time() + URL_BUDGET
+	for attempt in range(MAX_ATTEMPTS):
+		#response_time_ms reports the final attempt only
+		start_time = time.time()
+		def CalcTime():
+			return (time.time() - start_time) * 1000
+
+		#Nothing from an earlier attempt may leak into the final result
+		res["status_code"] = None
+		res["content_length"] = 0
+		res["word_count"] = None
+		res["error"] = None
+
+		retry_after = None
+		host_failed = False
+		try:
+			with urlreq.urlopen(url, timeout=min(GetTimeout(host, attempt), deadline - start_time)) as response:
+				res["response_time_ms"] = CalcTime()
+				res["timestamp"] = GetTimeStamp()
+				res["status_code"] = response.status
+				RecordSuccess(host, time.time() - start_time)
+				content_type = response.headers.get("Content-Type", "")
+				if "text" in content_type:
+					content = response.read()
+					res["content_length"] = len(content)
+					res["word_count"] = len(content.decode("utf-8", errors="ignore").split())
+			break
+		except urlerr.HTTPError as e:
 			res["response_time_ms"] = CalcTime()
 			res["timestamp"] = GetTimeStamp()
-			res["status_code"] = response.status
-			content_type = response.headers.get("Content-Type", "")
-			if "text" in content_type:
-				content = response.read()
-				res["content_length"] = len(content)
-				res["word_count"] = len(content.decode("utf-8", errors="ignore").split())
-	except urlerr.HTTPError as e:
-		res["response_time_ms"] = CalcTime()
-		res["timestamp"] = GetTimeStamp()
-		res["status_code"] = e.code
-		res["error"] = str(e)
-	except Exception as e:
-		res["response_time_ms"] = CalcTime()
-		res["timestamp"] = GetTimeStamp()
-		res["error"] = str(e)
+			res["status_code"] = e.code
+			res["error"] = str(e)
+			retry_after = ParseRetryAfter(e.headers.get("Retry-After") if e.headers else None)
+			if e.code in RETRY_CODES:
+				host_failed = True
+			else:
+				#Server answered, host is healthy
+				RecordSuccess(host, time.time() - start_time)
+			if not IsRetryable(e):
+				break
+		except Exception as e:
+			res["response_time_ms"] = CalcTime()
+			res["timestamp"] = GetTimeStamp()
+			res["error"] = str(e)
+			host_failed = True
+			if not IsRetryable(e):
+				break
 
-	return res
+		if attempt == MAX_ATTEMPTS - 1:
+			break
+		delay = GetBackoff(attempt, retry_after)
+		if time.time() + delay >= deadline:	#no budget left for another try
+			break
+		time.sleep(delay)
 
-def main():
-	input_path = sys.argv[1]
-	output_path = sys.argv[2]
+	if host_failed:
+		RecordFailure(host)
+	return res
 
+def Run(input_path, output_path):
 	#Load input file
 	urls = []
 	with open(input_path) as file:
@@ -105,4 +223,59 @@ def main():
 	with open(output_errors, "w") as file:
 		file.write("\n".join(errors))
 
-main()
\ No newline at end of file
+def IsJobReady(path):
+	#Unparseable files are left alone for a while in case the submitter is still writing them
+	try:
+		with open(path) as file:
+			json.load(file)
+		return True
+	except ValueError:	#bad JSON or bad UTF-8
+		return time.time() - os.path.getmtime(path) >= WORKER_SETTLE
+
+def Worker(job_dir):
+	#Persistent mode: each <name>.json in job_dir holds {"input": ..., "output": ...}
+	#Submitters write <name>.tmp and rename it to <name>.json, only .json files are picked up
+	#Host latency and circuit state carry over between jobs
+	os.makedirs(job_dir, exist_ok=True)
+	print(f'{GetTimeStamp()} Worker watching {job_dir}', flush=True)
+	while True:
+		ran = False
+		for job in sorted(f for f in os.listdir(job_dir) if f.endswith(".json")):
+			name = job[:-len(".json")]
+			running = f'{job_dir}/{name}.running'
+			try:
+				if not IsJobReady(f'{job_dir}/{job}'):
+					continue
+				os.rename(f'{job_dir}/{job}', running)	#claim, another worker may have taken it
+			except FileNotFoundError:
+				continue
+			status = {"job": name}
+			try:
+				with open(running) as file:
+					args = json.load(file)
+				Run(args["input"], args["output"])
+				status["status"] = "success"
+			except Exception as e:
+				status["status"] = "failed"
+				status["error"] = str(e)
+			status["timestamp"] = GetTimeStamp()
+			with open(f'{job_dir}/{name}.done', "w") as file:
+				json.dump(status, file, indent=2)
+			os.remove(running)
+			print(f'{status["timestamp"]} Job {name}: {status["status"]}', flush=True)
+			ran = True
+		if not ran:
+			time.sleep(WORKER_POLL)
+
+def main():
+	if len(sys.argv) == 3 and sys.argv[1] == "--worker":
+		Worker(sys.argv[2])
+	elif len(sys.argv) == 3:
+		Run(sys.argv[1], sys.argv[2])
+	else:
+		print(f'Usage: {sys.argv[0]} <input_file> <output_directory>', file=sys.stderr)
+		print(f'       {sys.argv[0]} --worker <job_directory>', file=sys.stderr)
+		sys.exit(1)
+
+if __name__ == "__main__":
+	main()
@@ -1,16 +1,27 @@
 import sys
+import os
 import json
-import urllib.request as urlreq
 import urllib.error as urlerr
 import urllib.parse as urlpars
-import xml.etree.ElementTree as ET
 import time
+import random
+import socket
 from datetime import datetime, timezone
 import re
+#urllib.request, xml.etree, email.utils, asyncio and textwrap are imported where used, they dominate startup time
 
 TIMEOUT = 30
 
-RETRY_CODE = 429
+MAX_ATTEMPTS = 3
+BACKOFF_BASE = 3  #ArXiv asks clients to wait ~3 seconds between calls
+BACKOFF_MAX = 30
+RETRY_CODES = {429, 500, 502, 503, 504}
+
+WORKER_POLL = 1
+WORKER_SETTLE = 5  #seconds an unparseable job file may still be being written
+
+QUEUE_DEPTH = 8  #items buffered between pipeline stages
+CHUNK_SIZE = 64 * 1024
 
 ARXIV = "http://export.arxiv.org/api/query"
 
@@ -25,38 +36,76 @@ STOPWORDS = {'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for'
              'all', 'each', 'every', 'both', 'few', 'more', 'most', 'other', 'some',
              'such', 'as', 'also', 'very', 'too', 'only', 'so', 'than', 'not'}
 
-#Outputs made Global for easier access
-papers = []
-analysis = {
-   "query": "",
-   "papers_processed": 0,
-   "processing_timestamp": "",
-   "corpus_stats": {
-      "total_abstracts": 0,
-      "total_words": 0,
-      "unique_words_global": 0,
-      "avg_abstract_length": 0.0,
-      "longest_abstract_words": 0,
-      "shortest_abstract_words": 0
-   },
-   "top_50_words": [],
-   "technical_terms": {
-      #set avoids duplicate, convert to list later
-      "uppercase_terms": set(),
-      "numeric_terms": set(),
-      "hyphenated_terms": set()
-   },
-   "category_distribution": {}
-}
+def NewAnalysis():
+   return {
+      "query": "",
+      "papers_processed": 0,
+      "processing_timestamp": "",
+      "corpus_stats": {
+         "total_abstracts": 0,
+         "total_words": 0,
+         "unique_words_global": 0,
+         "avg_abstract_length": 0.0,
+         "longest_abstract_words": 0,
+         "shortest_abstract_words": 0
+      },
+      "top_50_words": [],
+      "technical_terms": {
+         #set avoids duplicate, convert to list later
+         "uppercase_terms": set(),
+         "numeric_terms": set(),
+         "hyphenated_terms": set()
+      },
+      "category_distribution": {}
+   }
+
+#Outputs made Global for easier access (papers are streamed to disk instead)
+analysis = NewAnalysis()
 process = []
 
+def ResetState():
+   #Fresh outputs for each run, so a worker doesn't leak results between jobs
+   global analysis, process
+   analysis = NewAnalysis()
+   process = []
+
 def GetTimeStamp():
    return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
 
 def Log(msg):
    process.append(f'{GetTimeStamp()} {msg}')
 
-def QueryArxiv(search_query, max_results):
+def ParseRetryAfter(value):
+   #Retry-After is either delay-seconds or an HTTP-date
+   if value is None:
+      return None
+   try:
+      return max(0.0, float(value))
+   except ValueError:
+      pass
+   from email.utils import parsedate_to_datetime
+   try:
+      return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+   except (TypeError, ValueError):
+      return None
+
+def GetBackoff(attempt, retry_after=None):
+   if retry_after is not None:
+      return min(BACKOFF_MAX, retry_after)
+   #Exponential backoff with jitter, never shorter than the base delay nor longer than the cap
+   return min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt) * random.uniform(1, 1.5))
+
+def IsRetryable(e):
+   if isinstance(e, urlerr.HTTPError):
+      return e.code in RETRY_CODES
+   #DNS failures won't fix themselves within a run
+   if isinstance(e, urlerr.URLError) and isinstance(e.reason, socket.gaierror):
+      return False
+   return isinstance(e, (urlerr.URLError, TimeoutError, ConnectionError))
+
+def OpenArxiv(search_query, max_results):
+   import urllib.request as urlreq
+
    #Generate url
    params = {
       "search_query": search_query,
@@ -65,30 +114,28 @@ def QueryArxiv(search_query, max_results):
    }
    url = f'{ARXIV}?{urlpars.urlencode(params).replace("%3A",":")}'
 
-   #Start fetching
+   #Start fetching, the caller reads and closes the response
    status = ""
-   result = None
-   for i in range(3):
+   for attempt in range(MAX_ATTEMPTS):
+      retry_after = None
       try:
-         with urlreq.urlopen(url, timeout=TIMEOUT) as response:
-            xml_data = response.read()
-            try:
-               result = ET.fromstring(xml_data)
-            except Exception as e:
-               Log(f'Invalid XML: {str(e)}')
-               result = None
-            break
+         return status, urlreq.urlopen(url, timeout=TIMEOUT)
       except urlerr.HTTPError as e:
          status = str(e)
-         if e.code == RETRY_CODE:
-            time.sleep(3)
-            continue
-         break
+         if not IsRetryable(e):
+            break
+         retry_after = ParseRetryAfter(e.headers.get("Retry-After") if e.headers else None)
       except Exception as e:
          status = str(e)
-         break
-      
-   return status, result
+         if not IsRetryable(e):
+            break
+
+      if attempt < MAX_ATTEMPTS - 1:
+         delay = GetBackoff(attempt, retry_after)
+         Log(f'Retrying in {delay:.1f} seconds: {status}')
+         time.sleep(delay)
+
+   return status, None
 
 def FindElem(root, elem):
    return root.find(f'{{{ATOM}}}{elem}')
@@ -190,15 +237,23 @@ def ProducePaper(entry):
 
    return paper
 
+def WritePaper(file, paper, count):
+   import textwrap
+
+   #Same layout as json.dump(papers, file, indent=2), one paper at a time
+   file.write("[\n" if count == 0 else ",\n")
+   file.write(textwrap.indent(json.dumps(paper, indent=2), "  "))
+   file.flush()
+
+def ClosePapers(file, count):
+   file.write("\n]" if count > 0 else "[]")
+
 def ProduceOutput(output_path):
    #Convert to list (set is not json-compatible)
    analysis["technical_terms"]["uppercase_terms"] = list(analysis["technical_terms"]["uppercase_terms"])
    analysis["technical_terms"]["numeric_terms"] = list(analysis["technical_terms"]["numeric_terms"])
    analysis["technical_terms"]["hyphenated_terms"] = list(analysis["technical_terms"]["hyphenated_terms"])
 
-   with open(f'{output_path}/papers.json', "w") as file:
-      json.dump(papers, file, indent=2)
-
    with open(f'{output_path}/corpus_analysis.json', "w") as file:
       json.dump(analysis, file, indent=2)
 
@@ -214,89 +269,246 @@ def FindTopFreq(words_freq, num):
       max_data["documents"] = len(max_data["documents"])
       analysis["top_50_words"].append(max_data)
 
-def main():
-   search_query = sys.argv[1]
-   max_results = sys.argv[2]
-   output_path = sys.argv[3]
+def AggregatePaper(paper, state):
+   corpus_status = analysis["corpus_stats"]
+   technical_terms = analysis["technical_terms"]
+   unique_words = state["unique_words"]
+   words_freq = state["words_freq"]
+
+   #Produce analysis
+   length = paper["abstract_stats"]["total_words"]
+   corpus_status["total_abstracts"] += 1
+   corpus_status["total_words"] += length
+   if corpus_status["total_abstracts"] == 1:
+      corpus_status["longest_abstract_words"] = length
+      corpus_status["shortest_abstract_words"] = length
+   else:
+      corpus_status["longest_abstract_words"] = max(corpus_status["longest_abstract_words"], length)
+      corpus_status["shortest_abstract_words"] = min(corpus_status["shortest_abstract_words"], length)
+
+   #Analyze abstract
+   words = re.split(r'[,;.!?\n ]+', paper["abstract"])
+   for w in words:
+      if len(w) > 0:
+         #Check uppercase
+         if w == w.upper() and any(ch.isalpha() for ch in w) and w.lower() not in STOPWORDS:
+            technical_terms["uppercase_terms"].add(w)
+         #Check numeric
+         if any(ch.isdigit() for ch in w):
+            technical_terms["numeric_terms"].add(w)
+         #Check hyphen
+         if any(ch == '-' for ch in w):
+            technical_terms["hyphenated_terms"].add(w)
+         #Update unique words
+         unique_words.add(w.lower())
+         #Update words freq
+         w_lower = w.lower()
+         if w_lower not in STOPWORDS:
+            if w_lower in words_freq:
+               words_freq[w_lower]["frequency"] += 1
+               words_freq[w_lower]["documents"].add(paper["arxiv_id"])
+            else:
+               words_freq[w_lower] = {
+                  "word": w,
+                  "frequency": 1,
+                  "documents": {paper["arxiv_id"]}
+               }
+
+   for cat in paper["categories"]:
+      if cat in analysis["category_distribution"]:
+         analysis["category_distribution"][cat] += 1
+      else:
+         analysis["category_distribution"][cat] = 1
+
+#Pipeline stages, each ends by passing None downstream
+#A stage that hits an error keeps draining its input so upstream never blocks
+
+async def FetchStage(response, chunks):
+   import asyncio
+
+   ok = True
+   try:
+      while True:
+         chunk = await asyncio.to_thread(response.read, CHUNK_SIZE)
+         if len(chunk) == 0:
+            break
+         await chunks.put(chunk)
+   except Exception as e:
+      Log(f'Network error: {str(e)}')
+      ok = False
+   finally:
+      response.close()
+      await chunks.put(None)
+   return ok
+
+async def ParseStage(chunks, entries):
+   import xml.etree.ElementTree as ET
+
+   parser = ET.XMLPullParser(events=("start", "end"))
+   feed = None
+   ok = True
+   while True:
+      chunk = await chunks.get()
+      if chunk is None:
+         break
+      if not ok:
+         continue
+      try:
+         parser.feed(chunk)
+         for event, elem in parser.read_events():
+            if event == "start" and feed is None:
+               feed = elem
+            elif event == "end" and elem.tag == f'{{{ATOM}}}entry':
+               await entries.put(elem)
+               feed.remove(elem)  #the queue holds the only reference now
+      except ET.ParseError as e:
+         Log(f'Invalid XML: {str(e)}')
+         ok = False
+   if ok:
+      try:
+         parser.close()
+      except ET.ParseError as e:
+         Log(f'Invalid XML: {str(e)}')
+         ok = False
+   await entries.put(None)
+   return ok
+
+async def PaperStage(entries, papers):
+   while True:
+      entry = await entries.get()
+      if entry is None:
+         break
+      await papers.put(ProducePaper(entry))
+   await papers.put(None)
+   return True
+
+async def AggregateStage(papers, papers_file, state):
+   while True:
+      paper = await papers.get()
+      if paper is None:
+         break
+      WritePaper(papers_file, paper, state["count"])
+      state["count"] += 1
+      AggregatePaper(paper, state)
+   return True
+
+async def Pipeline(search_query, max_results, papers_file, state):
+   import asyncio
+
+   status, response = await asyncio.to_thread(OpenArxiv, search_query, max_results)
+
+   #ArXiv unreachable
+   if response is None:
+      Log(f'Network error: {status}')
+      return False
+
+   chunks = asyncio.Queue(QUEUE_DEPTH)
+   entries = asyncio.Queue(QUEUE_DEPTH)
+   papers = asyncio.Queue(QUEUE_DEPTH)
+   results = await asyncio.gather(
+      FetchStage(response, chunks),
+      ParseStage(chunks, entries),
+      PaperStage(entries, papers),
+      AggregateStage(papers, papers_file, state)
+   )
+   return all(results)
+
+def Run(search_query, max_results, output_path):
+   import asyncio
+
+   ResetState()
 
    #Query ArXiv
    Log(f'Starting ArXiv query: {search_query}')
-   status, result = QueryArxiv(search_query, max_results)
    analysis["query"] = search_query
 
-   #ArXiv unreachable
-   if result == None:
-      Log(f'Network error: {status}')
+   #Download, parse, and analysis overlap, papers.json is written as papers arrive
+   start_time = time.time()
+   state = {
+      "count": 0,
+      "unique_words": set(),
+      "words_freq": {}
+   }
+   with open(f'{output_path}/papers.json', "w") as papers_file:
+      try:
+         ok = asyncio.run(Pipeline(search_query, max_results, papers_file, state))
+      finally:
+         #Keep papers.json valid JSON even if a stage raised
+         ClosePapers(papers_file, state["count"])
+
+   if state["count"] == 0 and not ok:
       ProduceOutput(output_path)
-      sys.exit(1)
+      return 1
 
-   #Parse result
-   start_time = time.time()
-   entries = FindAllElem(result, "entry")
-   analysis["papers_processed"] = len(entries)
-   Log(f'Fetched {len(entries)} results from ArXiv API')
+   analysis["papers_processed"] = state["count"]
+   Log(f'Fetched {state["count"]} results from ArXiv API')
 
-   abstract_lengths = []
-   unique_words = set()
-   words_freq = {}
+   FindTopFreq(state["words_freq"], 50)
 
    corpus_status = analysis["corpus_stats"]
-   technical_terms = analysis["technical_terms"]
-
-   for entry in entries:
-      paper = ProducePaper(entry)
-      papers.append(paper)
-
-      #Produce analysis
-      corpus_status["total_abstracts"] += 1
-      corpus_status["total_words"] += paper["abstract_stats"]["total_words"]
-      abstract_lengths.append(paper["abstract_stats"]["total_words"])
-
-      #Analyze abstract
-      words = re.split(r'[,;.!?\n ]+', paper["abstract"])
-      for w in words:
-         if len(w) > 0:
-            #Check uppercase
-            if w == w.upper() and any(ch.isalpha() for ch in w) and w.lower() not in STOPWORDS:
-               technical_terms["uppercase_terms"].add(w)
-            #Check numeric
-            if any(ch.isdigit() for ch in w):
-               technical_terms["numeric_terms"].add(w)
-            #Check hyphen
-            if any(ch == '-' for ch in w):
-               technical_terms["hyphenated_terms"].add(w)
-            #Update unique words
-            unique_words.add(w.lower())
-            #Update words freq
-            w_lower = w.lower()
-            if w_lower not in STOPWORDS:
-               if w_lower in words_freq:
-                  words_freq[w_lower]["frequency"] += 1
-                  words_freq[w_lower]["documents"].add(paper["arxiv_id"])
-               else:
-                  words_freq[w_lower] = {
-                     "word": w,
-                     "frequency": 1,
-                     "documents": {paper["arxiv_id"]}
-                  }
-
-      for cat in paper["categories"]:
-         if cat in analysis["category_distribution"]:
-            analysis["category_distribution"][cat] += 1
-         else:
-            analysis["category_distribution"][cat] = 1
-
-   FindTopFreq(words_freq, 50)
-
-   corpus_status["unique_words_global"] = len(unique_words)
-   corpus_status["avg_abstract_length"] = corpus_status["total_words"] / corpus_status["total_abstracts"]
-   corpus_status["longest_abstract_words"] = max(abstract_lengths)
-   corpus_status["shortest_abstract_words"] = min(abstract_lengths)
+   corpus_status["unique_words_global"] = len(state["unique_words"])
+   if corpus_status["total_abstracts"] > 0:
+      corpus_status["avg_abstract_length"] = corpus_status["total_words"] / corpus_status["total_abstracts"]
 
    analysis["processing_timestamp"] = GetTimeStamp()
 
-   Log(f'Completed processing: {len(entries)} papers in {time.time()-start_time} seconds')
+   Log(f'Completed processing: {state["count"]} papers in {time.time()-start_time} seconds')
 
    ProduceOutput(output_path)
+   return 0 if ok else 1
+
+def IsJobReady(path):
+   #Unparseable files are left alone for a while in case the submitter is still writing them
+   try:
+      with open(path) as file:
+         json.load(file)
+      return True
+   except ValueError:  #bad JSON or bad UTF-8
+      return time.time() - os.path.getmtime(path) >= WORKER_SETTLE
+
+def Worker(job_dir):
+   #Persistent mode: each <name>.json in job_dir holds {"query": ..., "max_results": ..., "output": ...}
+   #Submitters write <name>.tmp and rename it to <name>.json, only .json files are picked up
+   os.makedirs(job_dir, exist_ok=True)
+   print(f'{GetTimeStamp()} Worker watching {job_dir}', flush=True)
+   while True:
+      ran = False
+      for job in sorted(f for f in os.listdir(job_dir) if f.endswith(".json")):
+         name = job[:-len(".json")]
+         running = f'{job_dir}/{name}.running'
+         try:
+            if not IsJobReady(f'{job_dir}/{job}'):
+               continue
+            os.rename(f'{job_dir}/{job}', running)  #claim, another worker may have taken it
+         except FileNotFoundError:
+            continue
+         status = {"job": name}
+         try:
+            with open(running) as file:
+               args = json.load(file)
+            code = Run(args["query"], args["max_results"], args["output"])
+            status["status"] = "success" if code == 0 else "failed"
+         except Exception as e:
+            status["status"] = "failed"
+            status["error"] = str(e)
+         status["timestamp"] = GetTimeStamp()
+         with open(f'{job_dir}/{name}.done', "w") as file:
+            json.dump(status, file, indent=2)
+         os.remove(running)
+         print(f'{status["timestamp"]} Job {name}: {status["status"]}', flush=True)
+         ran = True
+      if not ran:
+         time.sleep(WORKER_POLL)
+
+def main():
+   if len(sys.argv) == 3 and sys.argv[1] == "--worker":
+      Worker(sys.argv[2])
+   elif len(sys.argv) == 4:
+      sys.exit(Run(sys.argv[1], sys.argv[2], sys.argv[3]))
+   else:
+      print(f'Usage: {sys.argv[0]} <query> <max_results> <output_directory>', file=sys.stderr)
+      print(f'       {sys.argv[0]} --worker <job_directory>', file=sys.stderr)
+      sys.exit(1)
 
-main()
\ No newline at end of file
+if __name__ == "__main__":
+   main()
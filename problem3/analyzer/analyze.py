@@ -2,7 +2,6 @@ import json
 import os
 import time
 from datetime import datetime, timezone
-import re
 
 def jaccard_similarity(doc1_words, doc2_words):
     """Calculate Jaccard similarity between two documents."""
@@ -38,14 +37,14 @@ def main():
         print(f"Waiting for {input_file}...", flush=True)
         time.sleep(2)
 
-    # Read processed
+    # Read processed, weight counts each duplicate the fetcher skipped
     processed = []
     with open(input_file, "r") as file:
         process_status = json.load(file)
     if "results" in process_status:
         for res in process_status["results"]:
             if ("file" in res) and (res["file"] is not None):
-                processed.append(res["file"])
+                processed.append((res["file"], res.get("weight", 1)))
 
     # Create output directory
     os.makedirs("/shared/analysis", exist_ok=True)
@@ -59,43 +58,36 @@ def main():
     bigrams = {}
 
     src = "/shared/processed/"
-    for page in processed:
+    for page, weight in processed:
         print(f"Analyzing {page}...", flush=True)
         with open(f'{src}{page}', "r") as file:
             data = json.load(file)
 
-        total_words += data["statistics"]["word_count"]
-        total_word_length += data["statistics"]["word_count"] * data["statistics"]["avg_word_length"]
-        total_sentences += data["statistics"]["sentence_count"]
+        total_words += weight * data["statistics"]["word_count"]
+        total_word_length += weight * data["statistics"]["word_count"] * data["statistics"]["avg_word_length"]
+        total_sentences += weight * data["statistics"]["sentence_count"]
 
         # collect words, bigrams(don't cross sentences)
-        text = data["text"]
+        # sentences are already tokenized by the processor
         words = []
-        sentences = re.split(r'[,;.?!\n]+', text)
-        for sent in sentences:
-            sent = sent.strip()
-            if len(sent) > 0:
-                words_in_sent = []
-                for w in sent.split():
-                    if len(w) > 0:
-                        words.append(w)
-                        words_in_sent.append(w)
-                        w_lower = w.lower()
-                        if w_lower in words_freq:
-                            words_freq[w_lower]["count"] += 1
-                        else:
-                            words_freq[w_lower] = {
-                                "word": w,
-                                "count": 1
-                            }
-                # collect bigrams
-                if len(words_in_sent) > 1:  # must contains at least two words
-                    for i in range(len(words_in_sent)-1):
-                        big = f'{words_in_sent[i]} {words_in_sent[i+1]}'
-                        if big in bigrams:
-                            bigrams[big] += 1
-                        else:
-                            bigrams[big] = 1
+        for words_in_sent in data["sentences"]:
+            for w in words_in_sent:
+                words.append(w)
+                w_lower = w.lower()
+                if w_lower in words_freq:
+                    words_freq[w_lower]["count"] += weight
+                else:
+                    words_freq[w_lower] = {
+                        "word": w,
+                        "count": weight
+                    }
+            # collect bigrams
+            for i in range(len(words_in_sent)-1):
+                big = f'{words_in_sent[i]} {words_in_sent[i+1]}'
+                if big in bigrams:
+                    bigrams[big] += weight
+                else:
+                    bigrams[big] = weight
         docs_words.append({
             "doc": page,
             "words": words
@@ -129,7 +121,8 @@ def main():
     # Save analysis
     result = {
         "processing_timestamp": TimeStamp(),
-        "documents_processed": len(processed),
+        "documents_processed": sum(weight for page, weight in processed),
+        "unique_documents": len(processed),
         "total_words": total_words,
         "unique_words": unique_words,
         "top_100_words": top_100_words,
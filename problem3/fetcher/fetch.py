@@ -1,10 +1,176 @@
 #!/usr/bin/env python3
+import hashlib
 import json
 import os
+import random
+import re
+import socket
+from collections import deque
 import sys
 import time
+import urllib.error
+import urllib.parse
 import urllib.request
 from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+TIMEOUT = 10        # upper bound, also used until a host has enough latency samples
+MIN_TIMEOUT = 3
+TIMEOUT_FACTOR = 4  # adaptive timeout = p95 latency * factor
+MIN_SAMPLES = 3
+LATENCY_WINDOW = 50  # only the most recent samples per host are kept
+URL_BUDGET = TIMEOUT  # total time per url across all attempts, same worst case as a single try
+
+MAX_ATTEMPTS = 3
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 8
+RETRY_CODES = {429, 500, 502, 503, 504}
+
+BREAKER_THRESHOLD = 3  # consecutive failed urls (not attempts) before a host is skipped
+BREAKER_COOLDOWN = 30
+
+# Dedup: query params that never change the page, and how close SimHashes must be
+TRACKING_PARAMS = {"fbclid", "gclid", "dclid", "msclkid", "mc_cid", "mc_eid", "_ga"}
+DEFAULT_PORTS = {"http": 80, "https": 443}
+SIMHASH_BITS = 64
+SIMHASH_DISTANCE = 3
+SHINGLE_SIZE = 3  # words per feature, so word order counts
+MIN_SIMHASH_TOKENS = 20  # below this only exact content matches count
+
+TAG_RE = re.compile(r'<(script|style)[^>]*>.*?</\1>|<[^>]+>', re.DOTALL | re.IGNORECASE)
+TOKEN_RE = re.compile(r'\w+')
+
+# Per-host scheduler state
+host_latency = {}
+host_failures = {}
+host_open_until = {}
+
+def GetHost(url):
+    return urllib.parse.urlsplit(url).netloc.lower()
+
+def GetTimeout(host, attempt):
+    # p95 of observed latencies, doubled on each retry so slow responses still get through
+    # Hosts without enough history get TIMEOUT, which already uses up the whole URL_BUDGET
+    samples = sorted(host_latency.get(host, []))
+    if len(samples) < MIN_SAMPLES:
+        return TIMEOUT
+    p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+    return min(TIMEOUT, max(MIN_TIMEOUT, p95 * TIMEOUT_FACTOR) * (2 ** attempt))
+
+def ParseRetryAfter(value):
+    # Retry-After is either delay-seconds or an HTTP-date
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+def GetBackoff(attempt, retry_after=None):
+    if retry_after is not None:
+        return min(BACKOFF_MAX, retry_after)
+    # Full jitter
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+
+def IsCircuitOpen(host):
+    return host_open_until.get(host, 0) > time.time()
+
+def RecordSuccess(host, elapsed):
+    host_failures[host] = 0
+    host_latency.setdefault(host, deque(maxlen=LATENCY_WINDOW)).append(elapsed)
+
+def RecordFailure(host):
+    host_failures[host] = host_failures.get(host, 0) + 1
+    if host_failures[host] >= BREAKER_THRESHOLD:
+        host_open_until[host] = time.time() + BREAKER_COOLDOWN
+
+def IsRetryable(e):
+    if isinstance(e, urllib.error.HTTPError):
+        return e.code in RETRY_CODES
+    # DNS failures won't fix themselves within a run
+    if isinstance(e, urllib.error.URLError) and isinstance(e.reason, socket.gaierror):
+        return False
+    return isinstance(e, (urllib.error.URLError, TimeoutError, ConnectionError))
+
+def FetchContent(url):
+    """Fetch url with retries, backoff and per-host circuit breaking, returns body and final url."""
+    host = GetHost(url)
+    if IsCircuitOpen(host):
+        raise ConnectionError(f"Circuit open for {host} after {host_failures[host]} consecutive failures")
+
+    deadline = time.time() + URL_BUDGET
+    for attempt in range(MAX_ATTEMPTS):
+        start_time = time.time()
+        retry_after = None
+        try:
+            with urllib.request.urlopen(url, timeout=min(GetTimeout(host, attempt), deadline - start_time)) as response:
+                content = response.read()
+                final_url = response.geturl()
+            RecordSuccess(host, time.time() - start_time)
+            return content, final_url
+        except Exception as e:
+            host_failed = True
+            if isinstance(e, urllib.error.HTTPError):
+                if e.code not in RETRY_CODES:
+                    host_failed = False
+                    RecordSuccess(host, time.time() - start_time)
+                retry_after = ParseRetryAfter(e.headers.get("Retry-After") if e.headers else None)
+            delay = GetBackoff(attempt, retry_after)
+            # The breaker counts this url once, after its retries are used up
+            if not IsRetryable(e) or attempt == MAX_ATTEMPTS - 1 or time.time() + delay >= deadline:
+                if host_failed:
+                    RecordFailure(host)
+                raise
+        print(f"Retrying {url} in {delay:.1f}s...", flush=True)
+        time.sleep(delay)
+
+def CanonicalUrl(url):
+    """Normalize url so redirects, mirrors of the same path and tracking variants compare equal."""
+    try:
+        parts = urllib.parse.urlsplit(url.strip())
+        port = parts.port
+    except ValueError:
+        return url.strip()  # malformed, let the fetch fail and record it
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if port is not None and port != DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{port}"
+    query = [(k, v) for k, v in urllib.parse.parse_qsl(parts.query, keep_blank_values=True)
+             if not k.lower().startswith("utm_") and k.lower() not in TRACKING_PARAMS]
+    return urllib.parse.urlunsplit((scheme, host, parts.path or "/", urllib.parse.urlencode(sorted(query)), ""))
+
+def SimHash(content):
+    """64-bit SimHash over word shingles of the visible text, None if there are too few words to trust."""
+    text = TAG_RE.sub(' ', content.decode("utf-8", errors="ignore")).lower()
+    tokens = TOKEN_RE.findall(text)
+    if len(tokens) < MIN_SIMHASH_TOKENS:
+        return None
+    counts = {}
+    for i in range(len(tokens) - SHINGLE_SIZE + 1):
+        shingle = " ".join(tokens[i:i+SHINGLE_SIZE])
+        counts[shingle] = counts.get(shingle, 0) + 1
+    weights = [0] * SIMHASH_BITS
+    for shingle, count in counts.items():
+        h = int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=SIMHASH_BITS // 8).digest(), "big")
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += count if (h >> bit) & 1 else -count
+    return sum(1 << bit for bit in range(SIMHASH_BITS) if weights[bit] > 0)
+
+def FindDuplicate(pages, content_hash, simhash):
+    """Return (page, type) of the first saved page matching exactly or within SIMHASH_DISTANCE bits."""
+    for page in pages:
+        if page["content_hash"] == content_hash:
+            return page, "content"
+    if simhash is None:
+        return None, None
+    for page in pages:
+        if page["simhash"] is not None and bin(page["simhash"] ^ simhash).count("1") <= SIMHASH_DISTANCE:
+            return page, "near"
+    return None, None
 
 def main():
     print(f"[{datetime.now(timezone.utc).isoformat()}] Fetcher starting", flush=True)
@@ -24,22 +190,60 @@ def main():
     os.makedirs("/shared/raw", exist_ok=True)
     os.makedirs("/shared/status", exist_ok=True)
     
-    # Fetch each URL
+    # Fetch each URL, only distinct pages are saved for the processor
     results = []
+    seen_urls = {}  # canonical url -> saved page it resolved to
+    seen_pages = []  # saved pages: url, file, content_hash, simhash
     for i, url in enumerate(urls, 1):
         output_file = f"/shared/raw/page_{i}.html"
+        canonical = CanonicalUrl(url)
+        if canonical in seen_urls:
+            page = seen_urls[canonical]
+            print(f"Skipping {url}, same page as {page['url']}", flush=True)
+            results.append({
+                "url": url,
+                "file": None,
+                "canonical_url": canonical,
+                "content_hash": page["content_hash"],
+                "duplicate_of": page["file"],
+                "duplicate_type": "url",
+                "status": "duplicate"
+            })
+            continue
         try:
             print(f"Fetching {url}...", flush=True)
-            with urllib.request.urlopen(url, timeout=10) as response:
-                content = response.read()
-                with open(output_file, 'wb') as f:
-                    f.write(content)
-            results.append({
+            content, final_url = FetchContent(url)
+            content_hash = hashlib.sha256(content).hexdigest()
+            simhash = SimHash(content)
+            result = {
                 "url": url,
-                "file": f"page_{i}.html",
+                "file": None,
                 "size": len(content),
-                "status": "success"
-            })
+                "canonical_url": canonical,
+                "content_hash": content_hash,
+                "simhash": f"{simhash:016x}" if simhash is not None else None,
+                "duplicate_of": None
+            }
+            page = seen_urls.get(CanonicalUrl(final_url))  # redirected onto a page we have
+            if page is not None:
+                result["duplicate_type"] = "url"
+            else:
+                page, result["duplicate_type"] = FindDuplicate(seen_pages, content_hash, simhash)
+            if page is not None:
+                print(f"Skipping {url}, duplicate of {page['file']}", flush=True)
+                result["duplicate_of"] = page["file"]
+                result["status"] = "duplicate"
+            else:
+                with open(output_file, 'wb') as f:
+                    f.write(content)
+                del result["duplicate_type"]
+                result["file"] = f"page_{i}.html"
+                result["status"] = "success"
+                page = {"url": url, "file": result["file"], "content_hash": content_hash, "simhash": simhash}
+                seen_pages.append(page)
+            seen_urls[canonical] = page
+            seen_urls.setdefault(CanonicalUrl(final_url), page)
+            results.append(result)
         except Exception as e:
             results.append({
                 "url": url,
@@ -55,6 +259,7 @@ def main():
         "urls_processed": len(urls),
         "successful": sum(1 for r in results if r["status"] == "success"),
         "failed": sum(1 for r in results if r["status"] == "failed"),
+        "duplicates": sum(1 for r in results if r["status"] == "duplicate"),
         "results": results
     }
     
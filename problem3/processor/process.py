@@ -4,51 +4,66 @@ import time
 from datetime import datetime, timezone
 import re
 
+SCRIPT_RE = re.compile(r'<script[^>]*>.*?</script>', re.DOTALL | re.IGNORECASE)
+STYLE_RE = re.compile(r'<style[^>]*>.*?</style>', re.DOTALL | re.IGNORECASE)
+LINK_RE = re.compile(r'href=[\'"]?([^\'" >]+)', re.IGNORECASE)
+IMAGE_RE = re.compile(r'src=[\'"]?([^\'" >]+)', re.IGNORECASE)
+TAG_RE = re.compile(r'<[^>]+>')
+SPACE_RE = re.compile(r'\s+')
+
+# Shared tokenizer rules, the analyzer consumes the emitted tokens as-is
+SENTENCE_RE = re.compile(r'[.!?]+')
+WORD_RE = re.compile(r'[,;\s]+')
+
 def strip_html(html_content):
     """Remove HTML tags and extract text."""
     # Remove script and style elements
-    html_content = re.sub(r'<script[^>]*>.*?</script>', '', html_content, flags=re.DOTALL | re.IGNORECASE)
-    html_content = re.sub(r'<style[^>]*>.*?</style>', '', html_content, flags=re.DOTALL | re.IGNORECASE)
+    html_content = SCRIPT_RE.sub('', html_content)
+    html_content = STYLE_RE.sub('', html_content)
     
     # Extract links before removing tags
-    links = re.findall(r'href=[\'"]?([^\'" >]+)', html_content, flags=re.IGNORECASE)
+    links = LINK_RE.findall(html_content)
     
     # Extract images
-    images = re.findall(r'src=[\'"]?([^\'" >]+)', html_content, flags=re.IGNORECASE)
+    images = IMAGE_RE.findall(html_content)
     
     # Remove HTML tags
-    text = re.sub(r'<[^>]+>', ' ', html_content)
+    text = TAG_RE.sub(' ', html_content)
     
     # Clean whitespace
-    text = re.sub(r'\s+', ' ', text).strip()
+    text = SPACE_RE.sub(' ', text).strip()
     
     return text, links, images
 
 def TimeStamp():
 	return datetime.now(timezone.utc).isoformat()
 
-def AnalyzeText(text):
+def Tokenize(text):
+	"""Split text into paragraphs of sentences of words, dropping empty pieces."""
+	paragraphs = []
+	for parag in text.split('\n'):
+		sentences = []
+		for sent in SENTENCE_RE.split(parag):
+			words = [w for w in WORD_RE.split(sent) if len(w) > 0]
+			if len(words) > 0:	# not empty sentence
+				sentences.append(words)
+		if len(sentences) > 0:	# not empty parag
+			paragraphs.append(sentences)
+	return paragraphs
+
+def AnalyzeText(paragraphs):
 	result = {
 		"word_count": 0,
         "sentence_count": 0,
-        "paragraph_count": 0,
+        "paragraph_count": len(paragraphs),
         "avg_word_length": 0.0
 	}
 	total_word_length = 0
-	paragraphs = text.split('\n')
 	for parag in paragraphs:
-		parag = parag.strip()
-		if len(parag) > 0:	# not empty parag
-			result["paragraph_count"] += 1
-			sentences = re.split(r'[.!?]+', parag)
-			for sent in sentences:
-				sent = sent.strip()
-				if len(sent) > 0:	# not empty sentence
-					result["sentence_count"] += 1
-					for w in re.split(r'[,; ]+', sent):
-						if len(w) > 0:	# not empty word
-							result["word_count"] += 1
-							total_word_length += len(w)
+		result["sentence_count"] += len(parag)
+		for sent in parag:
+			result["word_count"] += len(sent)
+			total_word_length += sum(len(w) for w in sent)
 	result["avg_word_length"] = total_word_length / result["word_count"]
 	return result
 
@@ -61,14 +76,22 @@ def main():
 		print(f"Waiting for {input_file}...", flush=True)
 		time.sleep(2)
 	
-	# Read HTMLs
+	# Read HTMLs, duplicates have no file and only add weight to the page they copy
 	htmls = []
+	weights = {}
+	duplicates = []
 	with open(input_file, "r") as file:
 		fetch_status = json.load(file)
 	if "results" in fetch_status:
 		for res in fetch_status["results"]:
 			if ("file" in res) and (res["file"] is not None):
 				htmls.append(res["file"])
+				weights[res["file"]] = 1
+			elif res.get("duplicate_of") is not None:
+				duplicates.append(res["duplicate_of"])
+	for html in duplicates:
+		if html in weights:
+			weights[html] += 1
 
 	# Create output directory
 	os.makedirs("/shared/processed", exist_ok=True)
@@ -78,17 +101,19 @@ def main():
 	src = "/shared/raw/"
 	for html in htmls:
 		output_file = f'/shared/processed/{html.replace(".html", ".json")}'
-		res = {"html": html}
+		res = {"html": html, "weight": weights[html]}
 		try:
 			print(f'Processing {html}...', flush=True)
 			with open(f'{src}{html}', "r", encoding="utf-8") as file:
 				html_content = file.read()
 
 			text, links, images = strip_html(html_content)
-			statistics = AnalyzeText(text)
+			paragraphs = Tokenize(text)
+			statistics = AnalyzeText(paragraphs)
 			output = {
 				"source_file": html,
 				"text": text,
+				"sentences": [sent for parag in paragraphs for sent in parag],
 				"statistics": statistics,
 				"links": links,
 				"images": images,
@@ -111,6 +136,7 @@ def main():
         "htmls_processed": len(htmls),
         "successful": sum(1 for r in results if r["status"] == "success"),
         "failed": sum(1 for r in results if r["status"] == "failed"),
+        "duplicates_skipped": len(duplicates),
         "results": results
 	}
 